@@ -1,3 +1,7 @@
+import sys
+from collections import OrderedDict
+
+import h5py
 import numpy as np
 
 import pandas as pd
@@ -5,6 +9,15 @@ import pandas as pd
 import keras.backend as keras
 import tensorflow as tf
 
+DEFAULT_MEMORY_BUDGET = 1024 ** 3
+CHANGE_SCORES_CHUNK_SIZE = 1024
+PREPARED_ROW_MEMORY_SIZE = 2056 * 8 + 2 * 6 * 8 + 2 * 8 + 256
+PREVIEW_LINE_MEMORY_SIZE = 1024
+EXPORT_CHUNK_SIZE = 64
+EXPORT_CHUNK_CACHE_SIZE = 4 * 1024 ** 2
+CONCENTRATIONS_LABELS = ["co2", "ni", "ox", "ar", "he", "ne"]
+
+
 def compare_numpy_arrays_columns_with_nan(arr1, arr2, col_num):
     return ((arr1[:, col_num] == arr2[:, col_num])
             | (np.isnan(arr1[:, col_num])
@@ -18,6 +31,9 @@ def sort_array_by_column(arr, column_num, desc=False):
 
 
 def read_file(path):
+    if path and h5py.is_hdf5(path):
+        return read_hdf5_file(path)
+
     try:
         spectrums_full_data = pd.read_csv(path)
     except:
@@ -39,7 +55,7 @@ def read_raw_file(path):
     if "Start" not in lines[0]:
         return None
 
-    spectrum_full_data = list(lines.values())
+    spectrum_full_data = [line[:8] for line in lines.values()]
 
     indices_to_pop = []
     for index, line in lines.items():
@@ -58,6 +74,141 @@ def read_raw_file(path):
     return indices, None, spectrums, spectrum_full_data
 
 
+def read_hdf5_file(path):
+    with h5py.File(path, "r", rdcc_nbytes=EXPORT_CHUNK_CACHE_SIZE) as file:
+        spectrums = file["spectrums"][:]
+        wavelengths = file["wavelengths"][:]
+        row_numbers = file["row_numbers"][:]
+        voltage_and_pressure = (
+            file["voltage_and_pressure"][:] if "voltage_and_pressure" in file else None
+        )
+        concentrations = file["concentrations"][:] if "concentrations" in file else None
+        raw_columns = (
+            file["raw_columns"].asstr()[:] if "raw_columns" in file else None
+        )
+
+    if concentrations is not None and voltage_and_pressure is not None:
+        spectrums_full_data = pd.DataFrame(
+            np.concatenate([voltage_and_pressure, concentrations], axis=1),
+            columns=["Uin", "pressure"] + CONCENTRATIONS_LABELS,
+            index=row_numbers,
+        )
+        spectrums_full_data.attrs["wavelengths"] = wavelengths
+        return None, concentrations, spectrums, spectrums_full_data
+
+    if np.any(np.diff(row_numbers) < 0):
+        order = np.argsort(row_numbers, kind="stable")
+        row_numbers = row_numbers[order]
+        spectrums = spectrums[order]
+        raw_columns = raw_columns[order] if raw_columns is not None else None
+
+    spectrum_full_data = [
+        (list(raw_columns[i]) if raw_columns is not None else [""] * 3)
+        + ["%.3f" % value for value in spectrums[i, :5]]
+        for i in range(spectrums.shape[0])
+    ]
+    return (row_numbers - 1).tolist(), None, spectrums, spectrum_full_data
+
+
+def get_spectrum_data_wavelengths(spectrum_data):
+    full_data = spectrum_data.spectrum_full_data
+    if isinstance(full_data, pd.DataFrame):
+        if "wavelengths" in full_data.attrs:
+            return full_data.attrs["wavelengths"]
+        if full_data.shape[1] == 2056:
+            return full_data.columns[8:].astype(float).to_numpy()
+    return spectrum_data.wavelengths
+
+
+def create_export_dataset(
+    file, name, rows_number, columns_number, chunk_size, dtype="float64"
+):
+    return file.create_dataset(
+        name,
+        shape=(rows_number, columns_number),
+        dtype=dtype,
+        chunks=(max(min(chunk_size, rows_number), 1), columns_number),
+        maxshape=(None, columns_number),
+        compression="gzip",
+        shuffle=True,
+    )
+
+
+def export_spectrum_data(
+    path,
+    spectrum_data,
+    positions=None,
+    concentrations_predictor=None,
+    chunk_size=EXPORT_CHUNK_SIZE,
+):
+    if positions is None:
+        positions = np.arange(spectrum_data.data_len)
+    positions = np.unique(np.asarray(positions, dtype=int))
+    rows_number = positions.shape[0]
+    if rows_number and (positions[0] < 0 or positions[-1] >= spectrum_data.data_len):
+        raise ValueError("positions out of range for the exported spectrum data")
+
+    predict = concentrations_predictor is not None and concentrations_predictor.can_predict(
+        spectrum_data.voltage_and_pressure is not None
+    )
+
+    with h5py.File(path, "w", rdcc_nbytes=EXPORT_CHUNK_CACHE_SIZE) as file:
+        file.create_dataset("wavelengths", data=get_spectrum_data_wavelengths(spectrum_data))
+        file.create_dataset("row_numbers", data=spectrum_data.get_row_numbers()[positions])
+
+        spectrums_dataset = create_export_dataset(
+            file, "spectrums", rows_number, 2048, chunk_size
+        )
+        raw_columns_dataset = None
+        if spectrum_data.indices:
+            raw_columns_dataset = create_export_dataset(
+                file, "raw_columns", rows_number, 3, chunk_size, dtype=h5py.string_dtype()
+            )
+        voltage_and_pressure_dataset = None
+        if spectrum_data.voltage_and_pressure is not None:
+            voltage_and_pressure_dataset = create_export_dataset(
+                file, "voltage_and_pressure", rows_number, 2, chunk_size
+            )
+        concentrations_dataset = None
+        if spectrum_data.concentrations is not None:
+            concentrations_dataset = create_export_dataset(
+                file, "concentrations", rows_number, 6, chunk_size
+            )
+        predictions_dataset = None
+        if predict:
+            predictions_dataset = create_export_dataset(
+                file, "predictions", rows_number, 6, chunk_size
+            )
+
+        for start in range(0, rows_number, chunk_size):
+            chunk = slice(start, start + chunk_size)
+            chunk_positions = positions[chunk]
+
+            spectrums = spectrum_data.spectrums[chunk_positions].astype(float)
+            spectrums_dataset[chunk] = spectrums
+            if raw_columns_dataset is not None:
+                raw_columns_dataset[chunk] = spectrum_data.get_raw_columns(chunk_positions)
+
+            voltage_and_pressure = None
+            if voltage_and_pressure_dataset is not None:
+                voltage_and_pressure = spectrum_data.voltage_and_pressure[
+                    chunk_positions
+                ].astype(float)
+                voltage_and_pressure_dataset[chunk] = voltage_and_pressure
+            if concentrations_dataset is not None:
+                concentrations_dataset[chunk] = spectrum_data.concentrations[
+                    chunk_positions
+                ].astype(float)
+            if predictions_dataset is not None:
+                predictions_dataset[chunk] = (
+                    concentrations_predictor.predict_concentrations_batch(
+                        spectrums, voltage_and_pressure
+                    )
+                )
+
+    return rows_number
+
+
 def get_integer_from_string(string):
     if not string:
         return None
@@ -86,6 +237,72 @@ def get_float_from_string(string):
         return None
 
 
+def get_spectrum_change_scores(spectrums, chunk_size=CHANGE_SCORES_CHUNK_SIZE):
+    spectrums = np.asarray(spectrums, dtype=float)
+    scores = np.zeros(spectrums.shape[0])
+    if spectrums.shape[0] < 2:
+        return scores
+
+    norms = np.empty(spectrums.shape[0])
+    dot_products = np.empty(spectrums.shape[0] - 1)
+    for start in range(0, spectrums.shape[0], chunk_size):
+        chunk = spectrums[start:start + chunk_size]
+        norms[start:start + chunk_size] = np.sqrt(np.einsum("ij,ij->i", chunk, chunk))
+        next_chunk = spectrums[start + 1:start + chunk_size + 1]
+        dot_products[start:start + chunk_size] = np.einsum(
+            "ij,ij->i", chunk[:next_chunk.shape[0]], next_chunk
+        )
+    norms[norms == 0] = 1
+
+    cosines = dot_products / (norms[:-1] * norms[1:])
+    shape_change = np.sqrt(np.clip(2 - 2 * cosines, 0, None))
+    intensity_change = np.abs(np.diff(np.log(norms)))
+    scores[1:] = shape_change + intensity_change
+    return scores
+
+
+def detect_spectrum_events(spectrums, threshold=None, sensitivity=5.0):
+    scores = get_spectrum_change_scores(spectrums)
+    if scores.shape[0] < 2:
+        return np.array([], dtype=int), np.array([]), scores
+
+    if threshold is None:
+        median = np.median(scores[1:])
+        mad = np.median(np.abs(scores[1:] - median))
+        threshold = median + sensitivity * 1.4826 * mad
+
+    padded_scores = np.concatenate([[-np.inf], scores, [-np.inf]])
+    is_peak = (
+        (scores > threshold)
+        & (scores >= padded_scores[:-2])
+        & (scores > padded_scores[2:])
+    )
+    is_peak[0] = False
+
+    positions = np.flatnonzero(is_peak)
+    return positions, scores[positions], scores
+
+
+def decimate_spectrums(wavelengths, spectrums, bins_number):
+    spectrums = np.asarray(spectrums, dtype=float)
+    columns_number = spectrums.shape[1]
+
+    if columns_number <= 2 * bins_number:
+        xs = np.broadcast_to(wavelengths, spectrums.shape)
+        return np.stack([xs, spectrums], axis=-1)
+
+    edges = np.unique(np.linspace(0, columns_number, bins_number + 1).astype(int)[:-1])
+    ends = np.append(edges[1:], columns_number) - 1
+    bins_centers = (wavelengths[edges] + wavelengths[ends]) / 2
+
+    ys = np.empty((spectrums.shape[0], 2 * edges.shape[0]))
+    ys[:, 0::2] = np.minimum.reduceat(spectrums, edges, axis=1)
+    ys[:, 1::2] = np.maximum.reduceat(spectrums, edges, axis=1)
+    xs = np.broadcast_to(np.repeat(bins_centers, 2), ys.shape)
+
+    return np.stack([xs, ys], axis=-1)
+
+
 class SpectrumData:
     def __init__(
         self,
@@ -114,6 +331,11 @@ class SpectrumData:
         self.index = indices[0] if indices else 0
         self.indices = indices
         self.data_len = spectrums.shape[0]
+        self.is_hdf5 = bool(path) and h5py.is_hdf5(path)
+
+        self.events, self.events_severity, self.change_scores = detect_spectrum_events(
+            self.spectrums
+        )
 
     def get_spectrum(self):
         if self.indices:
@@ -173,6 +395,232 @@ class SpectrumData:
         if self.index < 0:
             self.index = self.data_len - 1
 
+    def get_position(self):
+        if self.indices:
+            return self.indices.index(self.index)
+        return self.index
+
+    def get_row_numbers(self):
+        if self.indices:
+            return np.array(self.indices) + 1
+        if self.is_hdf5 and isinstance(self.spectrum_full_data, pd.DataFrame):
+            return self.spectrum_full_data.index.to_numpy()
+        return np.arange(1, self.data_len + 1)
+
+    def get_row_number(self):
+        return int(self.get_row_numbers()[self.get_position()])
+
+    def set_position(self, position):
+        if self.indices:
+            self.index = self.indices[position]
+            return
+        self.index = position
+
+    def get_raw_columns(self, positions):
+        if self.is_hdf5:
+            lines = [self.spectrum_full_data[position] for position in positions]
+        else:
+            lines = [self.spectrum_full_data[self.indices[position]] for position in positions]
+        return [(line[:3] + [""] * 3)[:3] for line in lines]
+
+    def get_positions_from_row_numbers(self, row_numbers):
+        row_numbers = np.asarray(row_numbers, dtype=int)
+        all_row_numbers = self.get_row_numbers()
+        if all_row_numbers.shape[0] == 0:
+            return np.array([], dtype=int)
+        positions = np.searchsorted(all_row_numbers, row_numbers)
+        positions = np.minimum(positions, all_row_numbers.shape[0] - 1)
+        return positions[all_row_numbers[positions] == row_numbers]
+
+    def get_positions_by_concentration(self, column, min_value=0, max_value=1):
+        if self.concentrations is None:
+            return np.array([], dtype=int)
+        concentrations = self.concentrations[:, column].astype(float)
+        return np.flatnonzero((concentrations >= min_value) & (concentrations <= max_value))
+
+    def get_every_nth_position(self, n):
+        if n is None or n < 1:
+            return np.array([], dtype=int)
+        return np.arange(0, self.data_len, n)
+
+    def set_next_event_index(self):
+        if self.events.shape[0] == 0:
+            return
+        next_events = self.events[self.events > self.get_position()]
+        if next_events.shape[0] == 0:
+            self.set_position(self.events[0])
+            return
+        self.set_position(next_events[0])
+
+    def set_previous_event_index(self):
+        if self.events.shape[0] == 0:
+            return
+        previous_events = self.events[self.events < self.get_position()]
+        if previous_events.shape[0] == 0:
+            self.set_position(self.events[-1])
+            return
+        self.set_position(previous_events[-1])
+
+
+def get_spectrum_data_memory_size(spectrum_data):
+    memory_size = spectrum_data.spectrums.nbytes
+    if spectrum_data.concentrations is not None:
+        memory_size += spectrum_data.concentrations.nbytes
+    if spectrum_data.voltage_and_pressure is not None:
+        memory_size += spectrum_data.voltage_and_pressure.nbytes
+
+    full_data = spectrum_data.spectrum_full_data
+    if isinstance(full_data, pd.DataFrame):
+        memory_size += int(full_data.memory_usage(deep=True).sum())
+    elif full_data is not None:
+        memory_size += sum(
+            sys.getsizeof(line) + sum(map(sys.getsizeof, line)) for line in full_data
+        )
+    return memory_size
+
+
+class SpectrumFileInfo:
+    def __init__(self, path):
+        self.path = path
+        self.file_type = None
+        self.header = {}
+        self.rows_number = 0
+        self.lines_number = 0
+
+        try:
+            self.read_header()
+        except (OSError, UnicodeDecodeError):
+            self.file_type = None
+
+    def get_memory_size_estimate(self):
+        spectrums_memory_size = self.rows_number * 2048 * 8
+        if self.file_type == "prepared":
+            return spectrums_memory_size + self.rows_number * PREPARED_ROW_MEMORY_SIZE
+        return spectrums_memory_size + self.lines_number * PREVIEW_LINE_MEMORY_SIZE
+
+    def read_header(self):
+        if h5py.is_hdf5(self.path):
+            with h5py.File(self.path, "r") as file:
+                self.file_type = "hdf5"
+                self.header = {name: file[name].shape for name in file.keys()}
+                self.rows_number = file["spectrums"].shape[0]
+                self.lines_number = self.rows_number
+            return
+
+        with open(self.path, encoding="utf-8") as file:
+            first_line = file.readline()
+            columns = first_line.strip().split(",")
+
+            if len(columns) == 2056:
+                self.file_type = "prepared"
+                self.header = {"columns": columns[:8]}
+                self.rows_number = sum(1 for line in file if line.strip())
+                return
+
+            if "Start" not in first_line.split():
+                return
+
+            self.file_type = "raw"
+            keys = file.readline().split()
+            values = file.readline().split()
+            self.header = dict(zip(keys, values))
+            self.rows_number = 0
+            self.lines_number = 3
+            for line in file:
+                self.lines_number += 1
+                if line.count("\t") == 2050 and line[:1].isdigit():
+                    self.rows_number += 1
+
+
+class SpectrumCatalog:
+    def __init__(self, memory_budget=DEFAULT_MEMORY_BUDGET):
+        self.memory_budget = memory_budget
+        self.files_info = []
+        self.cache = OrderedDict()
+        self.memory_sizes = {}
+        self.current_file = None
+
+    def add_files(self, paths):
+        registered_paths = [file_info.path for file_info in self.files_info]
+        for path in paths:
+            if path in registered_paths:
+                continue
+            file_info = SpectrumFileInfo(path)
+            if file_info.file_type is None:
+                continue
+            self.files_info.append(file_info)
+            registered_paths.append(path)
+        return
+
+    def get_file_number(self, path):
+        for file_number, file_info in enumerate(self.files_info):
+            if file_info.path == path:
+                return file_number
+        return None
+
+    def get_rows_numbers(self):
+        return np.array([file_info.rows_number for file_info in self.files_info])
+
+    def get_session_length(self):
+        return int(self.get_rows_numbers().sum())
+
+    def get_session_position(self, file_number, position):
+        return int(self.get_rows_numbers()[:file_number].sum()) + position
+
+    def get_location(self, session_position):
+        rows_numbers_cumsum = np.cumsum(self.get_rows_numbers())
+        file_number = int(np.searchsorted(rows_numbers_cumsum, session_position, side="right"))
+        if file_number >= len(self.files_info):
+            return None
+        return file_number, session_position - self.get_session_position(file_number, 0)
+
+    def get_next_location(self, file_number, position):
+        session_length = self.get_session_length()
+        if session_length == 0:
+            return None
+        session_position = self.get_session_position(file_number, position) + 1
+        return self.get_location(session_position % session_length)
+
+    def get_previous_location(self, file_number, position):
+        session_length = self.get_session_length()
+        if session_length == 0:
+            return None
+        session_position = self.get_session_position(file_number, position) - 1
+        return self.get_location(session_position % session_length)
+
+    def get_cached_memory_size(self):
+        return sum(self.memory_sizes.values())
+
+    def get_spectrum_data(self, file_number):
+        path = self.files_info[file_number].path
+        self.current_file = file_number
+
+        if path in self.cache:
+            self.cache.move_to_end(path)
+            return self.cache[path]
+
+        memory_size_estimate = self.files_info[file_number].get_memory_size_estimate()
+        self.evict(max(self.memory_budget - memory_size_estimate, 0))
+
+        spectrum_data = SpectrumData(path=path)
+        self.files_info[file_number].rows_number = spectrum_data.data_len
+
+        memory_size = get_spectrum_data_memory_size(spectrum_data)
+        if memory_size > self.memory_budget:
+            self.evict(0)
+            return spectrum_data
+
+        self.evict(self.memory_budget - memory_size)
+        self.cache[path] = spectrum_data
+        self.memory_sizes[path] = memory_size
+        return spectrum_data
+
+    def evict(self, memory_limit):
+        while self.cache and self.get_cached_memory_size() > memory_limit:
+            path, _ = self.cache.popitem(last=False)
+            self.memory_sizes.pop(path)
+        return
+
 
 class ConcentrationsPredictor:
     def __init__(self, path=None):
@@ -180,11 +628,8 @@ class ConcentrationsPredictor:
             self.model=None
             return
 
-        p_multipler = np.ones(2048 + 2)
-        p_multipler[1] = 10000
-
         model = tf.keras.models.load_model(path, custom_objects={"custom_loss":
-                                                custom_loss, "p_multipler" : p_multipler}) if path else None
+                                                custom_loss, "p_multipler" : get_p_multipler()}) if path else None
         input_shape = model.layers[0].get_input_at(0).get_shape().as_list()[1]
         output_shape = model.layers[-1].get_output_at(0).get_shape().as_list()[1]
 
@@ -211,6 +656,30 @@ class ConcentrationsPredictor:
                     return self.model.predict(spectrum.reshape(1, 2050))[0]
         return np.zeros((6,))
 
+    def can_predict(self, voltage_and_pressure_available):
+        if self.model is None:
+            return False
+        return self.input_shape == 2048 or (
+            self.input_shape == 2050 and voltage_and_pressure_available
+        )
+
+    def predict_concentrations_batch(self, spectrums, voltage_and_pressure=None):
+        if self.model is not None:
+            if self.input_shape == 2048:
+                return self.model.predict(spectrums, batch_size=spectrums.shape[0])
+            if self.input_shape == 2050 and voltage_and_pressure is not None:
+                return self.model.predict(
+                    np.concatenate([voltage_and_pressure, spectrums], axis=1),
+                    batch_size=spectrums.shape[0],
+                )
+        return np.zeros((spectrums.shape[0], 6))
+
+
+def get_p_multipler():
+    p_multipler = np.ones(2048 + 2)
+    p_multipler[1] = 10000
+    return p_multipler
+
 
 def custom_loss(y_true, y_pred):
     mse = keras.mean(keras.square(y_true - y_pred), axis=-1)
@@ -4,6 +4,7 @@ import ntpath
 from PyQt5 import QtWidgets
 from PyQt5.QtCore import Qt
 from PyQt5.QtWidgets import (
+    QComboBox,
     QFileDialog,
     QFrame,
     QGridLayout,
@@ -19,10 +20,13 @@ from PyQt5.QtWidgets import (
 from PyQt5.QtGui import QFont, QIcon
 
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
+from matplotlib.collections import LineCollection
 from matplotlib.figure import Figure
 
-from backend import SpectrumData, ConcentrationsPredictor
+from backend import SpectrumData, SpectrumCatalog, ConcentrationsPredictor
 from backend import (
+    decimate_spectrums,
+    export_spectrum_data,
     get_float_from_string,
     get_integer_from_string,
     compare_numpy_arrays_columns_with_nan,
@@ -44,15 +48,20 @@ class MainWindow(QMainWindow):
         self.setCentralWidget(self.frame)
 
         self.spectrum_data = SpectrumData()
+        self.spectrum_catalog = SpectrumCatalog()
         self.concentrations_predictor = ConcentrationsPredictor()
 
+        self.overlay_spectrum_data = self.spectrum_data
+        self.overlay_positions = np.array([], dtype=int)
+        self.overlay_visible = True
+
         self.x_min = self.spectrum_data.wavelengths[0]
         self.x_max = self.spectrum_data.wavelengths[-1]
         self.y_min = -200
         self.y_max = 10000
 
         self.file_select_panel = FileSelectPanel(self)
-        self.file_select_panel.setFixedSize(450, 150)
+        self.file_select_panel.setFixedSize(450, 190)
         self.layout.addWidget(self.file_select_panel, *(0, 0, 1, 1))
 
         self.axes_setting_panel = AxesSettingPanel(self)
@@ -64,9 +73,13 @@ class MainWindow(QMainWindow):
         self.layout.addWidget(self.file_line_panel, *(2, 0, 1, 1))
 
         self.file_preview_table = FilePreviewTable(self)
-        self.file_preview_table.setFixedSize(450, 400)
+        self.file_preview_table.setFixedSize(450, 260)
         self.layout.addWidget(self.file_preview_table, *(3, 0, 1, 1))
 
+        self.overlay_panel = OverlayPanel(self)
+        self.overlay_panel.setFixedSize(450, 150)
+        self.layout.addWidget(self.overlay_panel, *(4, 0, 1, 1))
+
         self.spectrum_diagram = SpectrumDiagram(self)
         self.layout.addWidget(self.spectrum_diagram, *(0, 1, 10, 1))
 
@@ -74,20 +87,35 @@ class MainWindow(QMainWindow):
         self.spectrum_diagram.refresh_plots(self)
         self.spectrum_diagram.draw()
         self.file_line_panel.line_number_title_label.setText(
-            "Nr wiersza: " + str(self.spectrum_data.index + 1)
+            "Nr wiersza: " + str(self.spectrum_data.get_row_number())
         )
         return
 
     def draw_new_plots(self):
+        self.spectrum_diagram.setParent(None)
         self.spectrum_diagram = SpectrumDiagram(self)
         self.layout.addWidget(self.spectrum_diagram, *(0, 1, 10, 1))
 
+    def set_overlay_positions(self, positions):
+        self.overlay_spectrum_data = self.spectrum_data
+        self.overlay_positions = positions
+        self.spectrum_diagram.set_overlay(self)
+        self.spectrum_diagram.draw()
+        return
+
+    def set_overlay_visible(self, visible):
+        self.overlay_visible = visible
+        self.spectrum_diagram.overlay_ref.set_visible(visible)
+        self.spectrum_diagram.draw()
+        return
+
 
 class SpectrumDiagram(FigureCanvas):
     def __init__(self, main_window):
 
         self.fig = Figure(figsize=(5, 8), dpi=100)
-        self.ax1 = self.fig.add_subplot(121)
+        grid_spec = self.fig.add_gridspec(4, 2)
+        self.ax1 = self.fig.add_subplot(grid_spec[:3, 0])
         self.ax1.set_xlabel(r"$\lambda$ [nm]", fontsize=14)
         self.ax1.set_ylabel("Liczba zliczeń", fontsize=14)
         self.ax1.set_title("Widmo", fontsize=16)
@@ -102,9 +130,23 @@ class SpectrumDiagram(FigureCanvas):
         self.ax1.set_xlim(main_window.x_min, main_window.x_max)
         self.ax1.set_ylim(main_window.y_min, main_window.y_max)
 
+        self.overlay_ref = LineCollection([], linewidths=0.5, colors="black")
+        self.ax1.add_collection(self.overlay_ref, autolim=False)
+
+        self.ax4 = self.fig.add_subplot(grid_spec[3, 0])
+        self.ax4.set_xlabel("Nr wiersza", fontsize=14)
+        self.ax4.set_ylabel("Zmiana", fontsize=14)
+        self.change_scores_ref = self.ax4.plot([], [], color="gray")[0]
+        self.events_ref = LineCollection([], colors="orange")
+        self.ax4.add_collection(self.events_ref, autolim=False)
+        self.current_row_ref = self.ax4.axvline(
+            main_window.spectrum_data.get_row_number(), color="red"
+        )
+        self.set_change_scores(main_window)
+
         self.labels = ["CO2", "N", "O", "Ar", "He", "Ne"]
 
-        self.ax2 = self.fig.add_subplot(222)
+        self.ax2 = self.fig.add_subplot(grid_spec[:2, 1])
         self.ax2.grid(True)
         self.ax2.set_ylim(0, 1.1)
         self.ax2.set_ylabel("Stężenie", fontsize=14)
@@ -113,7 +155,7 @@ class SpectrumDiagram(FigureCanvas):
             self.labels, main_window.spectrum_data.get_concentrations(), color="green"
         )
 
-        self.ax3 = self.fig.add_subplot(224)
+        self.ax3 = self.fig.add_subplot(grid_spec[2:, 1])
         self.ax3.grid(True)
         self.ax3.set_ylim(0, 1.1)
         self.ax3.set_ylabel("Stężenie", fontsize=14)
@@ -128,10 +170,63 @@ class SpectrumDiagram(FigureCanvas):
 
         FigureCanvas.__init__(self, self.fig)
 
+        self.main_window = main_window
+        self.overlay_bins_number = None
+        self.set_overlay(main_window)
+        self.mpl_connect("resize_event", self.resize_overlay)
+
+        return
+
+    def set_change_scores(self, main_window):
+        spectrum_data = main_window.spectrum_data
+        row_numbers = spectrum_data.get_row_numbers()
+        self.change_scores_ref.set_data(row_numbers, spectrum_data.change_scores)
+
+        events_row_numbers = row_numbers[spectrum_data.events]
+        self.events_ref.set_segments(
+            [
+                [(row_number, 0), (row_number, severity)]
+                for row_number, severity in zip(
+                    events_row_numbers, spectrum_data.events_severity
+                )
+            ]
+        )
+
+        self.ax4.relim()
+        self.ax4.autoscale_view()
+        return
+
+    def get_overlay_bins_number(self):
+        self.overlay_bins_number = max(int(round(self.ax1.bbox.width)), 1)
+        return self.overlay_bins_number
+
+    def resize_overlay(self, event):
+        if max(int(round(self.ax1.bbox.width)), 1) != self.overlay_bins_number:
+            self.set_overlay(self.main_window)
+        return
+
+    def set_overlay(self, main_window):
+        spectrum_data = main_window.overlay_spectrum_data
+        positions = main_window.overlay_positions
+
+        visible_columns = np.flatnonzero(
+            (spectrum_data.wavelengths >= main_window.x_min)
+            & (spectrum_data.wavelengths <= main_window.x_max)
+        )
+        segments = decimate_spectrums(
+            spectrum_data.wavelengths[visible_columns],
+            spectrum_data.spectrums[np.ix_(positions, visible_columns)],
+            self.get_overlay_bins_number(),
+        )
+
+        self.overlay_ref.set_segments(segments)
+        self.overlay_ref.set_alpha(min(1.0, max(0.05, 10 / max(positions.shape[0], 1))))
+        self.overlay_ref.set_visible(main_window.overlay_visible)
         return
 
     def refresh_plots(self, main_window):
         self.plot_spectrum_ref.set_ydata(main_window.spectrum_data.get_spectrum())
+        self.current_row_ref.set_xdata([main_window.spectrum_data.get_row_number()] * 2)
 
         for i, concentrations in enumerate(
             main_window.spectrum_data.get_concentrations()
@@ -180,12 +275,21 @@ class FilePreviewTable(QWidget):
         self.table_widget.move(0, 0)
         self.layout.addWidget(self.table_widget, *(2, 0, 1, 1))
 
+    def get_selected_row_numbers(self):
+        rows = sorted({item.row() for item in self.table_widget.selectedItems()})
+        row_numbers = []
+        for row in rows:
+            item = self.table_widget.item(row, 0)
+            if item is not None:
+                row_numbers.append(get_integer_from_string(item.text()))
+        return [row_number for row_number in row_numbers if row_number is not None]
+
     def write_prepared_file_content(self):
         main_window = self.parent().parent()
 
         self.spectrum_data = main_window.spectrum_data.spectrum_full_data
         self.spectrum_data_np = self.spectrum_data.to_numpy()
-        indices = np.arange(1, self.spectrum_data_np.shape[0] + 1).reshape(
+        indices = main_window.spectrum_data.get_row_numbers().reshape(
             self.spectrum_data_np.shape[0], 1
         )
         self.spectrum_data_np = np.concatenate(
@@ -256,6 +360,31 @@ class FilePreviewTable(QWidget):
         if spectrum_data is not None:
             self.header.setSectionResizeMode(QtWidgets.QHeaderView.ResizeToContents)
 
+    def write_hdf5_file_content(self):
+        main_window = self.parent().parent()
+
+        spectrum_data = main_window.spectrum_data.spectrum_full_data
+        row_numbers = main_window.spectrum_data.get_row_numbers()
+        self.row_number = len(spectrum_data)
+
+        self.table_widget.setRowCount(self.row_number)
+
+        for i in range(self.row_number):
+            self.table_widget.setItem(i, 0, QTableWidgetItem(str(row_numbers[i])))
+            for j in range(1, min(len(spectrum_data[i]) + 1, 9)):
+                self.table_widget.setItem(
+                    i, j, QTableWidgetItem(str(spectrum_data[i][j - 1]))
+                )
+
+        self.header.setSectionResizeMode(QtWidgets.QHeaderView.ResizeToContents)
+
+
+def get_file_info_description(file_info):
+    lines = [file_info.path, "Liczba widm: " + str(file_info.rows_number)]
+    for key, value in file_info.header.items():
+        lines.append(str(key) + ": " + str(value))
+    return "\n".join(lines)
+
 
 class FileSelectPanel(QWidget):
     def __init__(self, parent):
@@ -291,6 +420,19 @@ class FileSelectPanel(QWidget):
         self.current_model_label.setFont(QFont("Arial", 10))
         self.layout.addWidget(self.current_model_label, *(3, 2, 1, 2))
 
+        self.choose_session_button = QPushButton("Sesja")
+        self.choose_session_button.setFixedSize(150, 30)
+        self.choose_session_button.clicked.connect(self.get_session_paths)
+        self.layout.addWidget(self.choose_session_button, *(4, 0, 1, 2))
+
+        self.session_combobox = QComboBox()
+        self.session_combobox.setFixedSize(250, 30)
+        self.session_combobox.setFont(QFont("Arial", 10))
+        self.session_combobox.currentIndexChanged.connect(self.set_session_file)
+        self.layout.addWidget(self.session_combobox, *(4, 2, 1, 2))
+
+        self.preview_table_path = None
+
     def get_spectrums_path(self):
         main_window = self.parent().parent()
         options = QFileDialog.Options()
@@ -302,16 +444,84 @@ class FileSelectPanel(QWidget):
             "Wszystkie pliki (*);;Pliki tekstowe (*.txt);; Pliki CSV (*.csv)",
             options=options,
         )
-        self.current_file_label.setText(ntpath.basename(file_path))
-        main_window.spectrum_data = SpectrumData(path=file_path)
+        main_window.spectrum_catalog.add_files([file_path])
+        file_number = main_window.spectrum_catalog.get_file_number(file_path)
+        if file_number is None:
+            return
+
+        self.set_session_file(file_number)
+        return
+
+    def get_session_paths(self):
+        main_window = self.parent().parent()
+        options = QFileDialog.Options()
+        options |= QFileDialog.DontUseNativeDialog
+        file_paths, _ = QFileDialog.getOpenFileNames(
+            self,
+            "Wybór plików sesji",
+            "",
+            "Wszystkie pliki (*);;Pliki tekstowe (*.txt);; Pliki CSV (*.csv)",
+            options=options,
+        )
+        main_window.spectrum_catalog.add_files(file_paths)
+        self.update_session_combobox(main_window)
+        return
+
+    def update_session_combobox(self, main_window):
+        self.session_combobox.blockSignals(True)
+        self.session_combobox.clear()
+        for file_number, file_info in enumerate(main_window.spectrum_catalog.files_info):
+            self.session_combobox.addItem(
+                ntpath.basename(file_info.path) + " (" + str(file_info.rows_number) + ")"
+            )
+            self.session_combobox.setItemData(
+                file_number, get_file_info_description(file_info), Qt.ToolTipRole
+            )
+        if main_window.spectrum_catalog.current_file is not None:
+            self.session_combobox.setCurrentIndex(main_window.spectrum_catalog.current_file)
+        self.session_combobox.blockSignals(False)
+        self.session_combobox.setToolTip(
+            self.session_combobox.itemData(
+                self.session_combobox.currentIndex(), Qt.ToolTipRole
+            )
+        )
+        return
+
+    def set_session_file(self, file_number, position=0):
+        main_window = self.parent().parent()
+        if file_number < 0 or file_number >= len(main_window.spectrum_catalog.files_info):
+            return
+
+        main_window.spectrum_data = main_window.spectrum_catalog.get_spectrum_data(file_number)
+        main_window.spectrum_data.set_position(position)
+        self.update_session_combobox(main_window)
+        self.current_file_label.setText(
+            ntpath.basename(main_window.spectrum_catalog.files_info[file_number].path)
+        )
+        self.show_spectrum_data(main_window)
+        return
+
+    def show_spectrum_data(self, main_window):
+        main_window.spectrum_diagram.set_change_scores(main_window)
         main_window.refresh_plots()
 
+        path = main_window.spectrum_catalog.files_info[
+            main_window.spectrum_catalog.current_file
+        ].path
+        if path == self.preview_table_path:
+            return
+
         self.reset_preview_table(main_window)
+        self.preview_table_path = path
 
         if main_window.spectrum_data.concentrations is not None:
             main_window.file_preview_table.write_prepared_file_content()
             return
 
+        if main_window.spectrum_data.is_hdf5:
+            main_window.file_preview_table.write_hdf5_file_content()
+            return
+
         main_window.file_preview_table.write_raw_file_content()
         return
 
@@ -331,7 +541,7 @@ class FileSelectPanel(QWidget):
     def reset_preview_table(self, main_window):
         main_window.file_preview_table.setParent(None)
         main_window.file_preview_table = FilePreviewTable(self)
-        main_window.file_preview_table.setFixedSize(450, 400)
+        main_window.file_preview_table.setFixedSize(450, 260)
         main_window.layout.addWidget(main_window.file_preview_table, *(3, 0, 1, 1))
 
 
@@ -482,21 +692,207 @@ class FileLinePanel(QWidget):
         self.set_line_button.clicked.connect(self.set_line)
         self.layout.addWidget(self.set_line_button, *(1, 4, 1, 1))
 
+        self.previous_event_button = QPushButton("<<")
+        self.previous_event_button.setFixedSize(50, 30)
+        self.previous_event_button.clicked.connect(self.draw_previous_event_spectrum)
+        self.layout.addWidget(self.previous_event_button, *(2, 1, 1, 1))
+
+        self.next_event_button = QPushButton(">>")
+        self.next_event_button.setFixedSize(50, 30)
+        self.next_event_button.clicked.connect(self.draw_next_event_spectrum)
+        self.layout.addWidget(self.next_event_button, *(2, 2, 1, 1))
+
+        self.events_label = QLabel("Zdarzenia")
+        self.events_label.setFixedSize(100, 30)
+        self.layout.addWidget(self.events_label, *(2, 3, 1, 2))
+
     def set_line(self):
         main_window = self.parent().parent()
-        index = get_integer_from_string(self.set_line_textbox.text())
-        main_window.spectrum_data.set_index(index - 1)
+        row_number = get_integer_from_string(self.set_line_textbox.text())
+        if row_number is None:
+            return
+        positions = main_window.spectrum_data.get_positions_from_row_numbers([row_number])
+        if positions.shape[0] == 0:
+            return
+        main_window.spectrum_data.set_position(positions[0])
         main_window.refresh_plots()
         return
 
     def draw_next_spectrum(self):
         main_window = self.parent().parent()
-        main_window.spectrum_data.set_next_index()
-        main_window.refresh_plots()
+        spectrum_catalog = main_window.spectrum_catalog
+        if spectrum_catalog.current_file is None:
+            main_window.spectrum_data.set_next_index()
+            main_window.refresh_plots()
+            return
+
+        location = spectrum_catalog.get_next_location(
+            spectrum_catalog.current_file, main_window.spectrum_data.get_position()
+        )
+        self.draw_session_location(location)
         return
 
     def draw_previous_spectrum(self):
         main_window = self.parent().parent()
-        main_window.spectrum_data.set_previous_index()
+        spectrum_catalog = main_window.spectrum_catalog
+        if spectrum_catalog.current_file is None:
+            main_window.spectrum_data.set_previous_index()
+            main_window.refresh_plots()
+            return
+
+        location = spectrum_catalog.get_previous_location(
+            spectrum_catalog.current_file, main_window.spectrum_data.get_position()
+        )
+        self.draw_session_location(location)
+        return
+
+    def draw_session_location(self, location):
+        main_window = self.parent().parent()
+        if location is None:
+            return
+
+        file_number, position = location
+        if file_number != main_window.spectrum_catalog.current_file:
+            main_window.file_select_panel.set_session_file(file_number, position)
+            return
+
+        main_window.spectrum_data.set_position(position)
+        main_window.refresh_plots()
+        return
+
+    def draw_next_event_spectrum(self):
+        main_window = self.parent().parent()
+        main_window.spectrum_data.set_next_event_index()
+        main_window.refresh_plots()
+        return
+
+    def draw_previous_event_spectrum(self):
+        main_window = self.parent().parent()
+        main_window.spectrum_data.set_previous_event_index()
         main_window.refresh_plots()
         return
+
+
+class OverlayPanel(QWidget):
+    def __init__(self, parent):
+        QWidget.__init__(self, parent=parent)
+        self.layout = QGridLayout(self)
+
+        self.overlay_label = QLabel("Nakładanie widm")
+        self.overlay_label.setFont(QFont("Arial", 16))
+        self.layout.addWidget(self.overlay_label, *(0, 0, 1, 4))
+
+        self.nth_label = QLabel("Co N-ty")
+        self.nth_label.setFixedSize(70, 30)
+        self.layout.addWidget(self.nth_label, *(1, 0, 1, 1))
+
+        self.nth_textbox = QLineEdit()
+        self.nth_textbox.setFixedSize(70, 30)
+        self.layout.addWidget(self.nth_textbox, *(1, 1, 1, 1))
+
+        self.nth_button = QPushButton("Ustaw")
+        self.nth_button.setFixedSize(70, 30)
+        self.nth_button.clicked.connect(self.set_every_nth_overlay)
+        self.layout.addWidget(self.nth_button, *(1, 2, 1, 1))
+
+        self.selected_button = QPushButton("Zaznaczone")
+        self.selected_button.setFixedSize(90, 30)
+        self.selected_button.clicked.connect(self.set_selected_rows_overlay)
+        self.layout.addWidget(self.selected_button, *(1, 3, 1, 1))
+
+        self.gas_combobox = QComboBox()
+        self.gas_combobox.addItems(["CO2", "N", "O", "Ar", "He", "Ne"])
+        self.gas_combobox.setFixedSize(70, 30)
+        self.layout.addWidget(self.gas_combobox, *(2, 0, 1, 1))
+
+        self.concentration_min_textbox = QLineEdit("0")
+        self.concentration_min_textbox.setFixedSize(70, 30)
+        self.layout.addWidget(self.concentration_min_textbox, *(2, 1, 1, 1))
+
+        self.concentration_max_textbox = QLineEdit("1")
+        self.concentration_max_textbox.setFixedSize(70, 30)
+        self.layout.addWidget(self.concentration_max_textbox, *(2, 2, 1, 1))
+
+        self.concentration_button = QPushButton("Filtr")
+        self.concentration_button.setFixedSize(90, 30)
+        self.concentration_button.clicked.connect(self.set_concentration_overlay)
+        self.layout.addWidget(self.concentration_button, *(2, 3, 1, 1))
+
+        self.toggle_button = QPushButton("Ukryj")
+        self.toggle_button.setFixedSize(70, 30)
+        self.toggle_button.clicked.connect(self.toggle_overlay)
+        self.layout.addWidget(self.toggle_button, *(3, 1, 1, 1))
+
+        self.clear_button = QPushButton("Wyczyść")
+        self.clear_button.setFixedSize(70, 30)
+        self.clear_button.clicked.connect(self.clear_overlay)
+        self.layout.addWidget(self.clear_button, *(3, 2, 1, 1))
+
+        self.export_button = QPushButton("Eksport")
+        self.export_button.setFixedSize(90, 30)
+        self.export_button.clicked.connect(self.export_selection)
+        self.layout.addWidget(self.export_button, *(3, 3, 1, 1))
+
+    def set_every_nth_overlay(self):
+        main_window = self.parent().parent()
+        n = get_integer_from_string(self.nth_textbox.text())
+        main_window.set_overlay_positions(
+            main_window.spectrum_data.get_every_nth_position(n)
+        )
+        return
+
+    def set_selected_rows_overlay(self):
+        main_window = self.parent().parent()
+        row_numbers = main_window.file_preview_table.get_selected_row_numbers()
+        main_window.set_overlay_positions(
+            main_window.spectrum_data.get_positions_from_row_numbers(row_numbers)
+        )
+        return
+
+    def set_concentration_overlay(self):
+        main_window = self.parent().parent()
+        min_value = get_float_from_string(self.concentration_min_textbox.text())
+        max_value = get_float_from_string(self.concentration_max_textbox.text())
+        main_window.set_overlay_positions(
+            main_window.spectrum_data.get_positions_by_concentration(
+                self.gas_combobox.currentIndex(),
+                0 if min_value is None else min_value,
+                1 if max_value is None else max_value,
+            )
+        )
+        return
+
+    def toggle_overlay(self):
+        main_window = self.parent().parent()
+        main_window.set_overlay_visible(not main_window.overlay_visible)
+        self.toggle_button.setText("Ukryj" if main_window.overlay_visible else "Pokaż")
+        return
+
+    def clear_overlay(self):
+        main_window = self.parent().parent()
+        main_window.set_overlay_positions(np.array([], dtype=int))
+        return
+
+    def export_selection(self):
+        main_window = self.parent().parent()
+        options = QFileDialog.Options()
+        options |= QFileDialog.DontUseNativeDialog
+        file_path, _ = QFileDialog.getSaveFileName(
+            self, "Eksport danych", "", "Pliki HDF (*.h5)", options=options
+        )
+        if not file_path:
+            return
+
+        spectrum_data = main_window.overlay_spectrum_data
+        positions = main_window.overlay_positions
+        if positions.shape[0] == 0:
+            spectrum_data = main_window.spectrum_data
+            positions = None
+
+        export_spectrum_data(
+            file_path,
+            spectrum_data,
+            positions=positions,
+            concentrations_predictor=main_window.concentrations_predictor,
+        )
+        return
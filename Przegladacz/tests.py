@@ -1,5 +1,20 @@
-from backend import get_float_from_string, get_integer_from_string
+from backend import (
+    get_float_from_string,
+    get_integer_from_string,
+    detect_spectrum_events,
+    decimate_spectrums,
+    SpectrumCatalog,
+    SpectrumData,
+    ConcentrationsPredictor,
+    export_spectrum_data,
+    get_spectrum_data_memory_size,
+    get_spectrum_data_wavelengths,
+)
+from training import CSV_COLUMNS_NUMBER, parse_csv_lines
 
+import h5py
+import numpy as np
+import pandas as pd
 import pytest
 
 
@@ -29,3 +44,190 @@ def test_get_float_from_string(string_input, expected_output):
 )
 def test_get_float_from_string(string_input, expected_output):
     assert get_integer_from_string(string_input) == expected_output
+
+
+@pytest.mark.parametrize("input_shape", [2048, 2050])
+def test_parse_csv_lines(input_shape):
+    line = ",".join(str(float(i)) for i in range(CSV_COLUMNS_NUMBER))
+    spectrums, concentrations = parse_csv_lines([line, line], input_shape)
+
+    assert spectrums.shape == (2, input_shape)
+    assert concentrations.numpy()[0].tolist() == [2.0, 3.0, 4.0, 5.0, 6.0, 7.0]
+    assert spectrums.numpy()[0, -1] == CSV_COLUMNS_NUMBER - 1
+
+
+def test_detect_spectrum_events():
+    rng = np.random.default_rng(0)
+    spectrums = 1000 + rng.normal(0, 1, size=(60, 2048))
+    spectrums[20:, 100:200] += 5000
+    spectrums[45:, 1000:1100] += 3000
+
+    events, severity, scores = detect_spectrum_events(spectrums)
+
+    assert events.tolist() == [20, 45]
+    assert severity.shape == (2,)
+    assert scores.shape == (60,)
+
+
+def test_decimate_spectrums():
+    wavelengths = np.arange(2048, dtype=float)
+    spectrums = np.tile(np.arange(2048, dtype=float), (3, 1))
+
+    segments = decimate_spectrums(wavelengths, spectrums, 256)
+
+    assert segments.shape == (3, 512, 2)
+    assert segments[0, :2, 1].tolist() == [0.0, 7.0]
+    assert segments[0, 0, 0] == 3.5
+
+
+def write_raw_file(path, rows_number):
+    with open(path, "w", encoding="utf-8") as file:
+        file.write("#### Start of parameters currently stored: ####\n")
+        file.write("Date\tTime\n2021-02-18\t11:05:18\n")
+        file.write("#### END OF PARAMETERS ####\n")
+        for i in range(rows_number):
+            values = "\t".join([str(float(i))] * 2048)
+            file.write("2021-02-18\t11:05:18\t" + str(i) + "\t" + values + "\n")
+
+
+def get_live_memory_size(spectrum_catalog, spectrum_data):
+    memory_size = spectrum_catalog.get_cached_memory_size()
+    if spectrum_data not in spectrum_catalog.cache.values():
+        memory_size += get_spectrum_data_memory_size(spectrum_data)
+    return memory_size
+
+
+def test_spectrum_catalog(tmp_path):
+    paths = [str(tmp_path / name) for name in ["a", "b", "c"]]
+    write_raw_file(paths[0], 3)
+    write_raw_file(paths[1], 2)
+    write_raw_file(paths[2], 6)
+
+    memory_sizes = [get_spectrum_data_memory_size(SpectrumData(path=path)) for path in paths]
+    spectrum_catalog = SpectrumCatalog()
+    spectrum_catalog.add_files(paths + [str(tmp_path / "missing")])
+    memory_budget = sum(
+        file_info.get_memory_size_estimate() for file_info in spectrum_catalog.files_info[:2]
+    )
+    spectrum_catalog.memory_budget = memory_budget
+
+    assert spectrum_catalog.get_rows_numbers().tolist() == [3, 2, 6]
+    assert spectrum_catalog.files_info[0].header == {"Date": "2021-02-18", "Time": "11:05:18"}
+    assert spectrum_catalog.get_next_location(0, 2) == (1, 0)
+    assert spectrum_catalog.get_previous_location(0, 0) == (2, 5)
+    assert memory_sizes[2] > memory_budget
+    for file_info, memory_size in zip(spectrum_catalog.files_info, memory_sizes):
+        assert file_info.get_memory_size_estimate() >= memory_size
+
+    for file_number in [0, 1, 2, 0, 1]:
+        spectrum_data = spectrum_catalog.get_spectrum_data(file_number)
+        if memory_sizes[file_number] > memory_budget:
+            assert len(spectrum_catalog.cache) == 0
+        else:
+            assert get_live_memory_size(spectrum_catalog, spectrum_data) <= memory_budget
+
+    assert list(spectrum_catalog.cache.keys()) == [paths[0], paths[1]]
+    assert spectrum_data.data_len == 2
+
+
+def test_export_spectrum_data(tmp_path):
+    raw_path = str(tmp_path / "raw")
+    export_path = str(tmp_path / "export.h5")
+    write_raw_file(raw_path, 5)
+    spectrum_data = SpectrumData(path=raw_path)
+
+    rows_number = export_spectrum_data(
+        export_path, spectrum_data, positions=[4, 1, 2], chunk_size=2
+    )
+    exported_spectrum_data = SpectrumData(path=export_path)
+
+    assert rows_number == 3
+    assert exported_spectrum_data.spectrums[:, 0].tolist() == [1.0, 2.0, 4.0]
+    assert exported_spectrum_data.indices == [5, 6, 8]
+    assert exported_spectrum_data.spectrum_full_data[0][:3] == ["2021-02-18", "11:05:18", "1"]
+    assert exported_spectrum_data.concentrations is None
+
+
+class FakeModel:
+    def predict(self, spectrums, batch_size=None):
+        return np.full((spectrums.shape[0], 6), 0.5)
+
+
+def test_export_prepared_spectrum_data(tmp_path):
+    csv_path = str(tmp_path / "prepared.csv")
+    export_path = str(tmp_path / "export.h5")
+    wavelengths = ["%.3f" % wavelength for wavelength in np.linspace(356.5, 900.0, 2048)]
+    rng = np.random.default_rng(0)
+    pd.DataFrame(
+        rng.random((4, 2056)),
+        columns=["Uin", "pressure", "co2", "ni", "ox", "ar", "he", "ne"] + wavelengths,
+    ).to_csv(csv_path, index=False)
+    spectrum_data = SpectrumData(path=csv_path)
+
+    concentrations_predictor = ConcentrationsPredictor()
+    concentrations_predictor.model = FakeModel()
+    concentrations_predictor.input_shape = 2050
+
+    export_spectrum_data(
+        export_path,
+        spectrum_data,
+        positions=[3, 0],
+        concentrations_predictor=concentrations_predictor,
+    )
+    exported_spectrum_data = SpectrumData(path=export_path)
+
+    assert np.array_equal(exported_spectrum_data.spectrums, spectrum_data.spectrums[[0, 3]])
+    assert np.array_equal(
+        exported_spectrum_data.concentrations, spectrum_data.concentrations[[0, 3]]
+    )
+    assert np.array_equal(
+        exported_spectrum_data.voltage_and_pressure,
+        spectrum_data.voltage_and_pressure[[0, 3]],
+    )
+    assert exported_spectrum_data.spectrum_full_data.columns.to_list() == (
+        spectrum_data.spectrum_full_data.columns.to_list()[:8]
+    )
+    assert get_spectrum_data_wavelengths(exported_spectrum_data).tolist() == [
+        float(wavelength) for wavelength in wavelengths
+    ]
+    assert exported_spectrum_data.get_row_numbers().tolist() == [1, 4]
+    assert exported_spectrum_data.get_positions_from_row_numbers([4, 2]).tolist() == [1]
+    with h5py.File(export_path, "r") as file:
+        assert file["row_numbers"][:].tolist() == [1, 4]
+        assert file["predictions"][:].tolist() == [[0.5] * 6] * 2
+
+
+def test_export_skips_unavailable_predictions(tmp_path):
+    raw_path = str(tmp_path / "raw")
+    export_path = str(tmp_path / "export.h5")
+    write_raw_file(raw_path, 2)
+
+    concentrations_predictor = ConcentrationsPredictor()
+    concentrations_predictor.model = FakeModel()
+    concentrations_predictor.input_shape = 2050
+
+    export_spectrum_data(
+        export_path,
+        SpectrumData(path=raw_path),
+        concentrations_predictor=concentrations_predictor,
+    )
+
+    with h5py.File(export_path, "r") as file:
+        assert "predictions" not in file
+
+
+def test_export_overlay_from_previous_file(tmp_path):
+    paths = [str(tmp_path / name) for name in ["a", "b"]]
+    write_raw_file(paths[0], 6)
+    write_raw_file(paths[1], 2)
+    overlay_spectrum_data = SpectrumData(path=paths[0])
+    spectrum_data = SpectrumData(path=paths[1])
+    export_path = str(tmp_path / "export.h5")
+
+    with pytest.raises(ValueError):
+        export_spectrum_data(export_path, spectrum_data, positions=[0, 5])
+    assert not (tmp_path / "export.h5").exists()
+
+    export_spectrum_data(export_path, overlay_spectrum_data, positions=[0, 5])
+
+    assert SpectrumData(path=export_path).spectrums[:, 0].tolist() == [0.0, 5.0]
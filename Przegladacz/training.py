@@ -0,0 +1,161 @@
+import argparse
+import glob
+import os
+
+import tensorflow as tf
+
+from backend import custom_loss, get_p_multipler
+
+
+CSV_COLUMNS_NUMBER = 2056
+CONCENTRATIONS_COLUMNS = slice(2, 8)
+SPECTRUM_COLUMNS = slice(8, CSV_COLUMNS_NUMBER)
+
+p_multipler = get_p_multipler()
+
+
+def get_csv_paths(patterns):
+    paths = []
+    for pattern in patterns:
+        paths.extend(sorted(glob.glob(pattern)))
+    return paths
+
+
+def parse_csv_lines(lines, input_shape=2050):
+    record_defaults = [[]] * CSV_COLUMNS_NUMBER
+    columns = tf.stack(tf.io.decode_csv(lines, record_defaults=record_defaults), axis=1)
+
+    concentrations = columns[:, CONCENTRATIONS_COLUMNS]
+    spectrums = columns[:, SPECTRUM_COLUMNS]
+
+    if input_shape == 2050:
+        spectrums = tf.concat([columns[:, :2], spectrums], axis=1)
+
+    return spectrums, concentrations
+
+
+def make_dataset(
+    paths,
+    input_shape=2050,
+    batch_size=32,
+    shuffle=True,
+    shuffle_buffer_size=10000,
+    cache_path=None,
+    parse_batch_size=256,
+):
+    autotune = tf.data.experimental.AUTOTUNE
+
+    files = tf.data.Dataset.from_tensor_slices(paths)
+    if shuffle:
+        files = files.shuffle(len(paths), reshuffle_each_iteration=True)
+
+    dataset = files.interleave(
+        lambda path: tf.data.TextLineDataset(path).skip(1),
+        cycle_length=min(len(paths), os.cpu_count() or 1),
+        num_parallel_calls=autotune,
+        deterministic=not shuffle,
+    )
+
+    dataset = dataset.batch(parse_batch_size)
+    dataset = dataset.map(
+        lambda lines: parse_csv_lines(lines, input_shape),
+        num_parallel_calls=autotune,
+        deterministic=not shuffle,
+    )
+    dataset = dataset.unbatch()
+
+    if cache_path:
+        dataset = dataset.cache(cache_path)
+
+    if shuffle:
+        dataset = dataset.shuffle(shuffle_buffer_size, reshuffle_each_iteration=True)
+
+    return dataset.batch(batch_size).prefetch(autotune)
+
+
+def build_model(input_shape=2050, hidden_layers=(512, 128)):
+    model = tf.keras.Sequential()
+    if input_shape == 2050:
+        model.add(
+            tf.keras.layers.Lambda(lambda x: x * p_multipler, input_shape=(input_shape,))
+        )
+    else:
+        model.add(tf.keras.layers.InputLayer(input_shape=(input_shape,)))
+
+    for units in hidden_layers:
+        model.add(tf.keras.layers.Dense(units, activation="relu"))
+    model.add(tf.keras.layers.Dense(6, activation="sigmoid"))
+
+    model.compile(optimizer="adam", loss=custom_loss, metrics=["mae"])
+    return model
+
+
+def train_model(
+    train_paths,
+    output_path,
+    test_paths=None,
+    input_shape=2050,
+    epochs=100,
+    batch_size=32,
+    shuffle_buffer_size=10000,
+    cache_dir=None,
+):
+    train_cache_path = os.path.join(cache_dir, "train") if cache_dir else None
+    test_cache_path = os.path.join(cache_dir, "test") if cache_dir else None
+
+    train_dataset = make_dataset(
+        train_paths,
+        input_shape=input_shape,
+        batch_size=batch_size,
+        shuffle_buffer_size=shuffle_buffer_size,
+        cache_path=train_cache_path,
+    )
+    test_dataset = None
+    if test_paths:
+        test_dataset = make_dataset(
+            test_paths,
+            input_shape=input_shape,
+            batch_size=batch_size,
+            shuffle=False,
+            cache_path=test_cache_path,
+        )
+
+    model = build_model(input_shape=input_shape)
+    model.fit(train_dataset, validation_data=test_dataset, epochs=epochs)
+    model.save(output_path, save_format="h5")
+    return model
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Trening sieci przewidującej stężenia")
+    parser.add_argument("--train", nargs="+", required=True)
+    parser.add_argument("--test", nargs="*", default=[])
+    parser.add_argument("--output", required=True)
+    parser.add_argument("--input-shape", type=int, choices=[2048, 2050], default=2050)
+    parser.add_argument("--epochs", type=int, default=100)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--shuffle-buffer-size", type=int, default=10000)
+    parser.add_argument("--cache-dir", default=None)
+    args = parser.parse_args()
+
+    train_paths = get_csv_paths(args.train)
+    if not train_paths:
+        parser.error("brak plików treningowych pasujących do: " + " ".join(args.train))
+
+    test_paths = get_csv_paths(args.test)
+    if args.test and not test_paths:
+        parser.error("brak plików testowych pasujących do: " + " ".join(args.test))
+
+    if args.cache_dir:
+        os.makedirs(args.cache_dir, exist_ok=True)
+
+    train_model(
+        train_paths,
+        args.output,
+        test_paths=test_paths,
+        input_shape=args.input_shape,
+        epochs=args.epochs,
+        batch_size=args.batch_size,
+        shuffle_buffer_size=args.shuffle_buffer_size,
+        cache_dir=args.cache_dir,
+    )